@@ -1,10 +1,413 @@
+import functools
+import io
 import json
+import mmap
+import multiprocessing
 import os
+import pickle
+import re
+import sys
+import time
+from array import array
 from datetime import datetime
+from collections import deque, namedtuple
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # Constants for file storage
 EVENT_LOG_FILE = "events.jsonl"  # Stores incoming event data
-CHECKPOINT_FILE = "checkpoint.json"  # Stores the last processing state
+CHECKPOINT_FILE = "checkpoint.pkl"  # Stores the last processing state
+CHECKPOINT_WAL_FILE = "checkpoint.wal"  # Append-only log of changes made since the last checkpoint
+PREVIOUS_WAL_FILE = CHECKPOINT_WAL_FILE + ".old"  # Log covered by a checkpoint that is still being written
+LEGACY_CHECKPOINT_FILE = "checkpoint.json"  # JSON checkpoint written by earlier versions; imported once
+
+# The write-ahead log is compacted into a full checkpoint once it grows past
+# this multiple of the checkpoint size (with a floor for small checkpoints)
+WAL_COMPACTION_RATIO = 4
+WAL_COMPACTION_MIN_BYTES = 64 * 1024
+
+# The event log is read and processed in blocks of this size, so memory use
+# stays bounded no matter how large the unread tail is
+READ_CHUNK_SIZE = 1024 * 1024
+
+# With PARSE_WORKERS set above 1, an unread tail of at least this size is split
+# into READ_CHUNK_SIZE byte ranges that are parsed in that many worker processes,
+# with at most two ranges per worker in flight at a time.
+# Workers return plain lists of IDs, categories and values, which the main
+# process unpickles in about a seventh of the time json.loads takes to parse
+# the same lines. Parsing is roughly a fifth of the total time to process a
+# large log, so with enough cores this saves up to about that share; applying
+# events to the state and the write-ahead log stays on the main process.
+# Workers are started with "spawn", which re-imports the calling script, so it
+# is off by default: only enable it (e.g. PARSE_WORKERS = os.cpu_count()) from
+# scripts that guard their entry point with `if __name__ == "__main__":`.
+# If the workers fail to start, the tail is read serially instead.
+PARALLEL_PARSE_MIN_BYTES = 32 * 1024 * 1024
+PARSE_WORKERS = 1
+
+# Identical records within a batch share one row, which only pays off when few
+# distinct (category, value) pairs repeat; the memo that finds them stops
+# growing at this many entries, so batches of unique records add no overhead
+BATCH_ROW_MEMO_SIZE = 4096
+
+# Matches an event line whose first key is a plain (unescaped) string "id",
+# so duplicates can be recognised without JSON-parsing the whole line
+_ID_RE = re.compile(rb'\s*\{\s*"id"\s*:\s*"([^"\\]*)"')
+
+def _parse_lines(data, skip_ids=None):
+    """
+    Parses a block of JSONL bytes into events.
+    All complete lines are decoded with a single json.loads call over a
+    JSON array, rather than one call per line.
+
+    Parameters:
+        data (bytes): Raw bytes read from the event log.
+        skip_ids (set, optional): Event IDs that are already known. Lines whose ID
+            can be read cheaply and is in this set are dropped before parsing.
+
+    Returns:
+        tuple: (list of parsed events, number of bytes consumed). An incomplete
+        last line is left unconsumed so it can be parsed once the rest is read.
+    """
+    end = data.rfind(b"\n") + 1
+    lines = [line for line in data[:end].split(b"\n") if line.strip()]
+
+    # Without a trailing newline the last line may still be being written;
+    # only take it if it already parses as a complete event
+    last = data[end:]
+    if last.strip():
+        try:
+            json.loads(last)
+        except ValueError:
+            pass
+        else:
+            lines.append(last)
+            end = len(data)
+
+    if skip_ids:
+        match = _ID_RE.match
+        lines = [
+            line for line in lines
+            if (m := match(line)) is None or m.group(1).decode() not in skip_ids
+        ]
+
+    if not lines:
+        return [], end
+    return json.loads(b"[" + b",".join(lines) + b"]"), end
+
+
+def _parse_range(path, start, end):
+    """
+    Parses the complete lines in a byte range of the event log.
+    Runs in a worker process for parallel parsing.
+
+    Parameters:
+        path (str): Path of the event log.
+        start (int): Offset of the first byte of the range (the start of a line).
+        end (int): Offset just past the last newline in the range.
+
+    Returns:
+        tuple: (IDs, categories, values) of the parsed events as parallel lists,
+        in log order; these are much cheaper to send back than one dict per event.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        events, _ = _parse_lines(f.read(end - start))
+    return (
+        [event["id"] for event in events],
+        [event["category"] for event in events],
+        [event["value"] for event in events]
+    )
+
+
+def _split_ranges(data, start, range_size):
+    """
+    Splits the complete lines of data from start onwards into byte ranges of
+    about range_size bytes, each beginning and ending on a line boundary.
+
+    Parameters:
+        data (mmap.mmap): The mapped event log.
+        start (int): Offset to start from.
+        range_size (int): Approximate size of each range in bytes.
+
+    Returns:
+        list: (start, end) offset pairs, in log order.
+    """
+    end = data.rfind(b"\n", start) + 1
+    if end <= start:
+        return []
+
+    step = max(range_size, 1)
+    bounds = [start]
+    while True:
+        boundary = data.find(b"\n", bounds[-1] + step - 1, end) + 1
+        if boundary == 0 or boundary >= end:
+            break
+        bounds.append(boundary)
+    bounds.append(end)
+    return list(zip(bounds, bounds[1:]))
+
+
+def _dump_checkpoint(checkpoint):
+    """
+    Pickles a checkpoint. Pickle is used over JSON as it is several times
+    faster to encode and decode.
+
+    Fast mode skips the pickler's memo, which would otherwise hold an entry
+    per event ID and make encoding about five times slower. It is only safe
+    because the checkpoint holds no object reachable twice or from itself;
+    test_checkpoint_has_no_shared_objects guards that.
+
+    Parameters:
+        checkpoint (Checkpoint): The checkpoint to serialize.
+
+    Returns:
+        memoryview: The pickled checkpoint, without a final bytes copy.
+    """
+    buffer = io.BytesIO()
+    pickler = pickle.Pickler(buffer, protocol=5)
+    pickler.fast = True
+    pickler.dump(checkpoint)
+    return buffer.getbuffer()
+
+
+def _write_checkpoint(data):
+    """
+    Durably writes serialized checkpoint data, then discards the write-ahead
+    log it supersedes. Runs on the processor's background checkpoint thread.
+
+    Parameters:
+        data (bytes-like): The pickled checkpoint.
+    """
+    # Write to a temporary file and atomically swap it in, so a crash
+    # mid-write never leaves a corrupt checkpoint behind
+    tmp_file = CHECKPOINT_FILE + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, CHECKPOINT_FILE)
+
+    if os.path.exists(PREVIOUS_WAL_FILE):
+        os.remove(PREVIOUS_WAL_FILE)
+
+
+@functools.lru_cache(maxsize=64)
+def _format_seconds(seconds):
+    """
+    Formats whole seconds since the epoch as a UTC ISO 8601 string.
+    Cached, since every event in a batch shares one timestamp.
+    """
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds))
+
+
+def format_timestamp(timestamp_ns):
+    """
+    Formats a nanosecond timestamp the way datetime.isoformat() does for a
+    naive UTC datetime, with microseconds only when they are non-zero.
+
+    Parameters:
+        timestamp_ns (int): Nanoseconds since the epoch.
+
+    Returns:
+        str: The ISO 8601 timestamp, e.g. "2025-01-31T12:00:00.123456".
+    """
+    seconds, nanos = divmod(timestamp_ns, 1_000_000_000)
+    micros = nanos // 1000
+    text = _format_seconds(seconds)
+    return f"{text}.{micros:06d}" if micros else text
+
+
+def _parse_legacy_timestamp(processed_at):
+    """
+    Converts a processed_at value from a legacy JSON checkpoint (an ISO 8601
+    UTC string, or already nanoseconds since the epoch) to nanoseconds.
+    """
+    if type(processed_at) is int:
+        return processed_at
+    elapsed = datetime.fromisoformat(processed_at) - datetime(1970, 1, 1)
+    return (elapsed.days * 86_400 + elapsed.seconds) * 1_000_000_000 + elapsed.microseconds * 1000
+
+
+def _intern(category):
+    """
+    Interns a category name so every record and caller shares one string object,
+    and comparisons against other interned names hit the identity fast path.
+    Non-string categories are returned unchanged.
+    """
+    return sys.intern(category) if type(category) is str else category
+
+
+# EventState attributes holding per-row columns that may be arrays
+_ARRAY_COLUMNS = ("_category_column", "_value_column", "_processed_at_column")
+
+
+class EventState(Mapping):
+    """
+    Read-only mapping of processed event IDs to their records.
+
+    Records are stored column-wise in parallel arrays (category code, value,
+    processing timestamp) rather than as one dict per event, which keeps the
+    per-event memory cost to a few machine words. Indexing by event ID returns
+    the record as a dict: {"category": ..., "value": ..., "processed_at": ...},
+    with processed_at formatted as an ISO 8601 UTC string only at that point.
+    """
+
+    def __init__(self):
+        self._rows = {}  # Event ID -> row index into the columns below (rows may be shared)
+        self._category_codes = {}  # (type, category name) -> small integer code
+        self._categories = []  # Category code -> category name
+        self._category_column = array("i")
+        self._value_column = array("q")  # Becomes a list if a value is not a 64-bit integer
+        self._processed_at_column = array("q")
+
+        # Rows added with the current processing timestamp, keyed by their
+        # contents, so identical records within a batch share a single row
+        # (up to BATCH_ROW_MEMO_SIZE distinct ones; released by end_batch)
+        self._batch_processed_at = None
+        self._batch_rows = {}
+
+    def add(self, event_id, category, value, processed_at):
+        """
+        Appends a record for a new event.
+        If an identical record (same category, value and timestamp) was added
+        in the same batch, the event ID is pointed at that row instead.
+
+        Parameters:
+            event_id (str): The event ID.
+            category (str): The event category.
+            value: The event value.
+            processed_at (int): Processing timestamp in nanoseconds since the epoch.
+
+        Returns:
+            bool: True if the record was added, False if the event ID is already present.
+        """
+        if event_id in self._rows:
+            return False
+
+        code = self._category_code(category)
+
+        if processed_at != self._batch_processed_at:
+            self._batch_processed_at = processed_at
+            self._batch_rows = {}
+
+        key = (code, type(value), value)  # Type included so 1, 1.0 and True stay distinct
+        if type(value) is float:
+            key = (code, float, repr(value))  # repr keeps -0.0 apart from 0.0
+        try:
+            row = self._batch_rows.get(key)
+        except TypeError:
+            row = key = None  # Unhashable value (list or object); always gets its own row
+
+        if row is None:
+            values = self._value_column
+            if type(values) is array and (type(value) is not int or not -2**63 <= value < 2**63):
+                values = self._value_column = list(values)  # Fall back to storing arbitrary JSON values
+
+            row = len(self._category_column)
+            self._category_column.append(code)
+            values.append(value)
+            self._processed_at_column.append(processed_at)
+            if key is not None and len(self._batch_rows) < BATCH_ROW_MEMO_SIZE:
+                self._batch_rows[key] = row
+
+        self._rows[event_id] = row
+        return True
+
+    def end_batch(self):
+        """
+        Releases the rows remembered for sharing within the current batch.
+        """
+        self._batch_processed_at = None
+        self._batch_rows = {}
+
+    def _category_code(self, category):
+        """
+        Returns the code for a category, assigning a new one on first use.
+        Codes are keyed by type as well as value, so True, 1 and 1.0 stay distinct;
+        unhashable categories (lists, objects) are found by scanning the table.
+        """
+        key = (type(category), category)
+        try:
+            code = self._category_codes.get(key)
+        except TypeError:
+            code = next((code for code, known in enumerate(self._categories)
+                         if type(known) is type(category) and known == category), None)
+            if code is None:
+                code = len(self._categories)
+                self._categories.append(category)
+            return code
+
+        if code is None:
+            category = _intern(category)
+            code = self._category_codes[key] = len(self._categories)
+            self._categories.append(category)
+        return code
+
+    def __getstate__(self):
+        # The category code table is rebuilt on load, and array columns are
+        # pickled straight from their buffers instead of via a tobytes() copy
+        state = self.__dict__.copy()
+        del state["_category_codes"], state["_batch_processed_at"], state["_batch_rows"]
+        for name in _ARRAY_COLUMNS:
+            column = state[name]
+            if type(column) is array:
+                state[name] = (column.typecode, pickle.PickleBuffer(column))
+        return state
+
+    def __setstate__(self, state):
+        for name in _ARRAY_COLUMNS:
+            if type(state[name]) is tuple:
+                typecode, data = state[name]
+                state[name] = array(typecode, data)
+
+        # Unpickled strings are fresh copies; re-intern the category names
+        self.__dict__.update(state)
+        self._categories = [_intern(category) for category in self._categories]
+        self._category_codes = {}
+        for code, category in enumerate(self._categories):
+            try:
+                self._category_codes[(type(category), category)] = code
+            except TypeError:
+                pass  # Unhashable categories are found by scanning the table
+        self.end_batch()
+
+    def __getitem__(self, event_id):
+        row = self._rows[event_id]
+        return {
+            "category": self._categories[self._category_column[row]],
+            "value": self._value_column[row],
+            "processed_at": format_timestamp(self._processed_at_column[row])
+        }
+
+    def __contains__(self, event_id):
+        return event_id in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def keys(self):
+        return self._rows.keys()
+
+
+class Checkpoint(namedtuple("Checkpoint", ["state", "log_offset", "timestamp", "log_identity"],
+                             defaults=(None,))):
+    """
+    Fixed-shape checkpoint record, pickled as a plain tuple of its fields.
+
+    Fields:
+        state (EventState): Records of all processed events.
+        log_offset (int): Byte offset in the event log to resume reading from.
+        timestamp (int): When the checkpoint was taken, in nanoseconds since the epoch.
+        log_identity (tuple): (st_dev, st_ino) of the event log log_offset refers to,
+            or None if unknown (checkpoints written by earlier versions).
+    """
+    __slots__ = ()
+
 
 class EventProcessor:
     """
@@ -19,86 +422,345 @@ class EventProcessor:
         Loads the last checkpoint (if available) to resume processing
         from the last successfully processed event.
         """
-        self.state = {}  # Dictionary to store processed events
-        self.processed_events = set()  # Set to track processed event IDs
+        self.state = EventState()  # Records of processed events, keyed by event ID
+        self._log_offset = 0  # Byte offset in the event log up to which events have been read
+        self._event_log = None  # Event log file kept open between runs
+        self._event_log_inode = None  # (st_dev, st_ino) of the event log _log_offset refers to
+        self._checkpoint_size = 0  # Size in bytes of the last checkpoint
+        self._needs_checkpoint = False  # Set when the loaded state is not fully covered by checkpoint.pkl
         self.load_checkpoint()  # Load the last saved processing state
+        self._wal = open(CHECKPOINT_WAL_FILE, "ab")  # Changes are appended here between checkpoints
+
+        # Checkpoints are written on a background thread so disk writes overlap
+        # with processing the next batch
+        self._checkpoint_executor = ThreadPoolExecutor(max_workers=1)
+        self._pending_checkpoint = None
+
+        if self._needs_checkpoint:
+            self.save_checkpoint()
+            self.wait_for_checkpoint()
 
-    def process_event(self, event):
+    @property
+    def processed_events(self):
+        """
+        IDs of all processed events.
+        Every processed event has an entry in state, so its keys double as the
+        duplicate-detection index instead of keeping a second copy of every ID.
+        """
+        return self.state.keys()
+
+    def process_event(self, event, processed_at=None):
         """
         Processes an individual event while ensuring duplicates are skipped.
 
         Parameters:
             event (dict): The event data containing 'id', 'category', and 'value'.
+            processed_at (int, optional): Processing timestamp in nanoseconds since the epoch.
+                Batches pass one shared timestamp; defaults to the current time.
+
+        Returns:
+            bool: True if the event was processed, False if it was a duplicate.
         """
-        event_id = event["id"]
-        
-        # Skip processing if the event was already handled
-        if event_id in self.processed_events:
-            return  
-
-        # Store the event in state with timestamp
-        self.state[event_id] = {
-            "category": event["category"],
-            "value": event["value"],
-            "processed_at": datetime.utcnow().isoformat()  # Record processing timestamp
-        }
-        self.processed_events.add(event_id)  # Mark as processed
+        return self.process_events((event,), processed_at) == 1
+
+    def process_events(self, events, processed_at=None):
+        """
+        Processes a batch of events while ensuring duplicates are skipped.
+        The loop works on local names only and the write-ahead log entries for
+        the whole batch are written in one call, keeping per-event overhead low.
+
+        Parameters:
+            events (iterable): Event dicts containing 'id', 'category', and 'value'.
+            processed_at (int, optional): Processing timestamp in nanoseconds since the epoch,
+                shared by the whole batch; defaults to the current time.
+
+        Returns:
+            int: The number of events processed, excluding duplicates.
+
+        Raises:
+            KeyError: If an event is missing a field. Events before it remain processed.
+        """
+        return self._process_records(
+            ((event["id"], event["category"], event["value"]) for event in events),
+            processed_at
+        )
+
+    def _process_records(self, records, processed_at=None):
+        """
+        Processes (event ID, category, value) tuples; see process_events.
+        """
+        if processed_at is None:
+            processed_at = time.time_ns()  # Record processing timestamp
+
+        add = self.state.add
+        dumps = json.dumps
+        wal_lines = []
+
+        try:
+            for event_id, category, value in records:
+                # Store the event in state with timestamp, skipping it if it was already handled
+                if add(event_id, category, value, processed_at):
+                    wal_lines.append(dumps((event_id, category, value, processed_at)))
+        finally:
+            self.state.end_batch()
+            # Append the changes to the write-ahead log so they survive a crash,
+            # including those made before an invalid event stopped the batch
+            if wal_lines:
+                self._wal.write(("\n".join(wal_lines) + "\n").encode())
+        return len(wal_lines)
 
     def save_checkpoint(self):
         """
-        Saves the current processing state and list of processed events
-        to a checkpoint file to enable crash recovery.
+        Saves the current processing state to a checkpoint file to enable crash recovery.
+        Processed event IDs are not stored separately, as they are the keys of the state.
+
+        The state is serialized immediately, but written to disk on a background
+        thread. The current write-ahead log is set aside until that write completes,
+        and new changes go to a fresh log, so a crash at any point still recovers.
         """
-        checkpoint = {
-            "processed_events": list(self.processed_events),  # Convert set to list for JSON serialization
-            "timestamp": datetime.utcnow().isoformat(),
-            "state": self.state
-        }
+        self.wait_for_checkpoint()  # Only one checkpoint write in flight at a time
+
+        checkpoint = Checkpoint(self.state, self._log_offset, time.time_ns(), self._event_log_inode)
+        data = _dump_checkpoint(checkpoint)
+        self._checkpoint_size = len(data)
+
+        self._wal.flush()
+        os.fsync(self._wal.fileno())
+        if os.path.exists(PREVIOUS_WAL_FILE):
+            # A log set aside before a crash is not covered by any checkpoint on
+            # disk yet; never overwrite it, append the current log to it instead
+            with open(CHECKPOINT_WAL_FILE, "rb") as src, open(PREVIOUS_WAL_FILE, "ab") as dst:
+                while chunk := src.read(READ_CHUNK_SIZE):
+                    dst.write(chunk)
+                dst.flush()
+                os.fsync(dst.fileno())
+            self._wal.truncate(0)
+        else:
+            self._wal.close()
+            os.replace(CHECKPOINT_WAL_FILE, PREVIOUS_WAL_FILE)
+            self._wal = open(CHECKPOINT_WAL_FILE, "ab")
 
-        # Write the checkpoint to file
-        with open(CHECKPOINT_FILE, "w") as f:
-            json.dump(checkpoint, f)
+        self._pending_checkpoint = self._checkpoint_executor.submit(_write_checkpoint, data)
+
+    def wait_for_checkpoint(self):
+        """
+        Blocks until the checkpoint being written in the background (if any)
+        is on disk, re-raising any error from writing it.
+        """
+        if self._pending_checkpoint is not None:
+            pending, self._pending_checkpoint = self._pending_checkpoint, None
+            pending.result()
+
+    def _append_wal_marker(self):
+        """
+        Records the current event log offset, and the file it refers to, in the
+        write-ahead log and, once the log has grown large relative to the
+        checkpoint, compacts it into a full checkpoint.
+        """
+        marker = {"offset": self._log_offset, "log": self._event_log_inode}
+        self._wal.write((json.dumps(marker) + "\n").encode())
+        self._wal.flush()
+        os.fsync(self._wal.fileno())
+
+        if self._wal.tell() > max(self._checkpoint_size * WAL_COMPACTION_RATIO, WAL_COMPACTION_MIN_BYTES):
+            self.save_checkpoint()
 
     def load_checkpoint(self):
         """
-        Loads the last saved processing state from the checkpoint file.
-        If no checkpoint exists, starts from an empty state.
+        Loads the last saved processing state from the checkpoint file,
+        then replays any changes recorded in the write-ahead logs since.
+        A set-aside log is replayed too, since the checkpoint covering it may
+        not have finished writing; replaying changes already in it is harmless.
+        If no checkpoint exists, a legacy checkpoint.json is imported instead,
+        or processing starts from an empty state.
+        The checkpoint is a pickle written by save_checkpoint, so it must only
+        ever be loaded from a trusted location.
         """
         if os.path.exists(CHECKPOINT_FILE):
-            with open(CHECKPOINT_FILE, "r") as f:
-                checkpoint = json.load(f)
-                self.state = checkpoint.get("state", {})
-                self.processed_events = set(checkpoint.get("processed_events", []))  # Convert back to set for fast lookup
+            with open(CHECKPOINT_FILE, "rb") as f:
+                checkpoint = pickle.load(f)
+                self.state = checkpoint.state
+                self._log_offset = checkpoint.log_offset
+                self._event_log_inode = checkpoint.log_identity
+            self._checkpoint_size = os.path.getsize(CHECKPOINT_FILE)
+        elif os.path.exists(LEGACY_CHECKPOINT_FILE):
+            self._import_legacy_checkpoint()
+
+        if os.path.exists(PREVIOUS_WAL_FILE):
+            self._needs_checkpoint = True  # Cover the set-aside log with a checkpoint right away
+
+        for wal_file in (PREVIOUS_WAL_FILE, CHECKPOINT_WAL_FILE):
+            if not os.path.exists(wal_file):
+                continue
+            valid_size = 0  # Bytes of complete entries read so far
+            with open(wal_file, "rb") as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b"\n"):
+                            raise ValueError("incomplete entry")
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # Torn write from a crash; everything before it is intact
+                    if type(entry) is dict:
+                        # End-of-batch marker: log offset and the file it refers to
+                        self._log_offset = entry["offset"]
+                        self._event_log_inode = tuple(entry["log"]) if entry["log"] else None
+                    elif type(entry) is int:
+                        self._log_offset = entry  # Offset marker written by earlier versions
+                    else:
+                        self.state.add(*entry)  # [event_id, category, value, processed_at]
+                    valid_size += len(line)
+
+            # Drop a torn entry, so that entries appended later are not hidden behind it
+            if os.path.getsize(wal_file) > valid_size:
+                os.truncate(wal_file, valid_size)
+        self.state.end_batch()
+
+    def _import_legacy_checkpoint(self):
+        """
+        Loads the state from a checkpoint.json written by earlier versions, which
+        is saved as checkpoint.pkl right after. Its processed_events list always
+        matched the state keys, so only the state is needed. The log offset is
+        not trusted and starts at 0; already processed events are skipped as duplicates.
+        """
+        with open(LEGACY_CHECKPOINT_FILE, "r") as f:
+            checkpoint = json.load(f)
+        for event_id, record in checkpoint.get("state", {}).items():
+            self.state.add(event_id, record["category"], record["value"],
+                           _parse_legacy_timestamp(record["processed_at"]))
+        self.state.end_batch()
+        self._needs_checkpoint = True
+
+    def close(self):
+        """
+        Waits for any background checkpoint write, then flushes and closes
+        the write-ahead log and the event log.
+        """
+        try:
+            self.wait_for_checkpoint()
+        finally:
+            # Release every handle even if the background write failed
+            self._checkpoint_executor.shutdown()
+            self._wal.close()
+            if self._event_log is not None:
+                self._event_log.close()
+                self._event_log = None
+
+    def _open_event_log(self, stat):
+        """
+        Returns the open event log file, opening it only on first use or when
+        the file on disk has been replaced (e.g. rotated or deleted and recreated).
+        The file the saved offset refers to is restored with it, so a replacement
+        is detected the same way whether it happened while running or while stopped.
+
+        Parameters:
+            stat (os.stat_result): Current status of the event log path.
+        """
+        inode = (stat.st_dev, stat.st_ino)
+        if self._event_log_inode is not None and self._event_log_inode != inode:
+            self._log_offset = 0  # A different file; read it from the start
+            if self._event_log is not None:
+                self._event_log.close()
+                self._event_log = None
+
+        if self._event_log is None:
+            self._event_log = open(EVENT_LOG_FILE, "rb")
+        self._event_log_inode = inode
+        return self._event_log
+
+    def _process_in_parallel(self, log, processed_at):
+        """
+        Parses the complete lines in the unread tail of the event log in worker
+        processes, one byte range per task, and processes the results in log order.
+        Only a few ranges are in flight at once, so memory use stays bounded.
+        Any incomplete last line is left for the regular streaming read, as is
+        everything after the last processed range if the worker pool breaks.
+
+        Parameters:
+            log (file): The open event log.
+            processed_at (int): Processing timestamp shared by the batch.
+
+        Returns:
+            bool: True if new events were processed, False otherwise.
+        """
+        with mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            ranges = iter(_split_ranges(data, self._log_offset, READ_CHUNK_SIZE))
+
+        processed_any = False
+        # Workers are spawned rather than forked, since the background
+        # checkpoint thread may be running and forking a threaded process is unsafe
+        context = multiprocessing.get_context("spawn")
+        try:
+            with ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=context) as pool:
+                in_flight = deque()
+
+                def submit_next():
+                    next_range = next(ranges, None)
+                    if next_range is not None:
+                        start, end = next_range
+                        in_flight.append((pool.submit(_parse_range, EVENT_LOG_FILE, start, end), end))
+
+                for _ in range(2 * PARSE_WORKERS):
+                    submit_next()
+
+                while in_flight:
+                    future, end = in_flight.popleft()
+                    ids, categories, values = future.result()
+                    submit_next()
+
+                    if self._process_records(zip(ids, categories, values), processed_at):  # Duplicates are skipped inside
+                        processed_any = True
+                    self._log_offset = end  # Only after the whole range was processed
+        except BrokenProcessPool:
+            pass  # Workers died or could not start; the streaming read resumes from _log_offset
+        return processed_any
 
     def recover_and_process(self):
         """
         Recovers the last processing state and processes new events from the log file.
-        Ensures events are processed in order and prevents duplicate processing.
+        Events are processed in the order they were appended and duplicates are skipped.
         
         Returns:
             bool: True if new events were processed, False otherwise.
         """
-        if not os.path.exists(EVENT_LOG_FILE):
-            print("No event log found. Nothing to process.")
+        try:
+            stat = os.stat(EVENT_LOG_FILE)
+        except FileNotFoundError:
             return False  # No event log means nothing to process
 
-        # Read events from the log file and clean up whitespace
-        with open(EVENT_LOG_FILE, "r") as f:
-            events = [json.loads(line.strip()) for line in f if line.strip()]  # Strip extra whitespace and filter empty lines
+        start_offset = self._log_offset
+        log = self._open_event_log(stat)
 
-        # Ensure events are processed in a sequential order
-        events.sort(key=lambda x: x["id"])
+        # If the log shrank below the saved offset it was truncated or rewritten,
+        # so rescan it from the start (duplicates are still skipped below)
+        if stat.st_size < self._log_offset:
+            self._log_offset = 0
 
         processed_any = False  # Flag to track if new events were processed
+        batch_ts = time.time_ns()  # One processing timestamp shared by the whole batch
+
+        # Parse a large unread tail across several processes first
+        if PARSE_WORKERS > 1 and stat.st_size - self._log_offset >= max(PARALLEL_PARSE_MIN_BYTES, 1):
+            if self._process_in_parallel(log, batch_ts):
+                processed_any = True
+
+        # Stream the (remaining) unread tail of the log block by block, carrying any
+        # incomplete line over into the next block
+        log.seek(self._log_offset)
+        pending = b""
+        while block := log.read(READ_CHUNK_SIZE):
+            data = pending + block
+            events, consumed = _parse_lines(data, self.processed_events)
+            pending = data[consumed:]
+
+            if self.process_events(events, batch_ts):  # Duplicates are skipped inside
+                processed_any = True
 
-        for event in events:
-            if event["id"] in self.processed_events:
-                continue  # Skip already processed events
-            
-            self.process_event(event)  # Process new event
-            processed_any = True
+            # Only move past the block once all of it was processed, so an
+            # invalid event is raised again next time instead of skipping the rest
+            self._log_offset += consumed
 
-        if processed_any:
-            self.save_checkpoint()  # Save updated state after processing new events
+        if processed_any or self._log_offset != start_offset:
+            self._append_wal_marker()  # Persist updated state and log position after reading new events
 
         return processed_any  # Return whether any new events were processed
@@ -1,7 +1,16 @@
 import json
 import os
+import pickle
+import time
 import unittest
-from event_processor import EventProcessor, EVENT_LOG_FILE, CHECKPOINT_FILE
+from datetime import datetime, timedelta
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+import event_processor
+from event_processor import (
+    EventProcessor, EventState, format_timestamp,
+    EVENT_LOG_FILE, CHECKPOINT_FILE, CHECKPOINT_WAL_FILE, PREVIOUS_WAL_FILE, LEGACY_CHECKPOINT_FILE
+)
 
 # Sample test events representing different categories and values
 test_events = [
@@ -13,15 +22,32 @@ test_events = [
     {"id": "A6", "category": "inventory", "value": 55},
 ]
 
+# Set VERBOSE=1 to print progress and state dumps while the tests run
+VERBOSE = bool(os.environ.get("VERBOSE"))
+
+def log(*args):
+    """
+    Prints the given values only when running in verbose mode.
+    """
+    if VERBOSE:
+        print(*args)
+
 def reset_files():
     """
     Resets the event log and checkpoint files before running each test.
     This ensures each test starts with a clean slate.
     """
-    for file in [EVENT_LOG_FILE, CHECKPOINT_FILE]:
+    for file in [EVENT_LOG_FILE, CHECKPOINT_FILE, CHECKPOINT_FILE + ".tmp", CHECKPOINT_WAL_FILE, PREVIOUS_WAL_FILE, LEGACY_CHECKPOINT_FILE]:
         if os.path.exists(file):
             os.remove(file)
 
+def stored_rows(state):
+    """
+    Returns how many rows an EventState stores; events with identical
+    records in one batch share a row, so this can be less than len(state).
+    """
+    return len(state._processed_at_column)
+
 class TestEventProcessor(unittest.TestCase):
     """
     Test suite for the EventProcessor class.
@@ -37,6 +63,24 @@ class TestEventProcessor(unittest.TestCase):
         reset_files()
         self.processor = EventProcessor()
 
+    def tearDown(self):
+        """
+        Runs after each test case.
+        Closes the processor's write-ahead log.
+        """
+        self.processor.close()
+
+    def print_state(self, label):
+        """
+        Prints the processor's state as formatted JSON in verbose mode.
+        The state is only formatted when it will actually be printed.
+
+        Parameters:
+            label (str): Description printed before the state.
+        """
+        if VERBOSE:
+            print(label, json.dumps(dict(self.processor.state), indent=2))
+
     def write_events(self, events):
         """
         Writes a list of events to the event log file.
@@ -53,10 +97,10 @@ class TestEventProcessor(unittest.TestCase):
         Test Scenario 1: Initial Processing
         Ensures that the processor correctly processes all events when run for the first time.
         """
-        print("\nRunning test_initial_processing...")
+        log("\nRunning test_initial_processing...")
         self.write_events(test_events)  # Write test events to the event log
         self.processor.recover_and_process()  # Process events
-        print("State after processing:", json.dumps(self.processor.state, indent=2))
+        self.print_state("State after processing:")
         self.assertEqual(len(self.processor.state), len(test_events))  # Validate correct processing
 
     def test_crash_recovery(self):
@@ -64,15 +108,15 @@ class TestEventProcessor(unittest.TestCase):
         Test Scenario 2: Simulated Crash & Recovery
         Ensures that the processor correctly resumes processing from the last checkpoint.
         """
-        print("\nRunning test_crash_recovery...")
+        log("\nRunning test_crash_recovery...")
         self.write_events(test_events[:3])  # Write only first 3 events to simulate a crash
         self.processor.recover_and_process()
-        print("State after first processing:", json.dumps(self.processor.state, indent=2))
+        self.print_state("State after first processing:")
         self.assertEqual(len(self.processor.state), 3)  # Only 3 events should be processed
 
         self.write_events(test_events)  # Rewrite all events (simulate recovery)
         self.processor.recover_and_process()
-        print("State after recovery:", json.dumps(self.processor.state, indent=2))
+        self.print_state("State after recovery:")
         self.assertEqual(len(self.processor.state), len(test_events))  # All events should be processed now
 
     def test_duplicate_events(self):
@@ -80,7 +124,7 @@ class TestEventProcessor(unittest.TestCase):
         Test Scenario 3: Duplicate Event Handling
         Ensures that duplicate events are ignored and not reprocessed.
         """
-        print("\nRunning test_duplicate_events...")
+        log("\nRunning test_duplicate_events...")
         self.write_events(test_events)
         self.processor.recover_and_process()
 
@@ -88,15 +132,15 @@ class TestEventProcessor(unittest.TestCase):
         self.write_events([test_events[0]])
         self.processor.recover_and_process()
         
-        print("State after handling duplicate events:", json.dumps(self.processor.state, indent=2))
+        self.print_state("State after handling duplicate events:")
         self.assertEqual(len(self.processor.state), len(test_events))  # Count should remain the same
 
     def test_out_of_order_events(self):
         """
         Test Scenario 4: Out-of-Order Events
-        Ensures that events are processed in correct order, even if they arrive out of sequence.
+        Ensures that all events are processed correctly, even if they arrive out of sequence.
         """
-        print("\nRunning test_out_of_order_events...")
+        log("\nRunning test_out_of_order_events...")
         out_of_order_events = [
             {"id": "A3", "category": "inventory", "value": 50},
             {"id": "A1", "category": "sales", "value": 100},
@@ -108,7 +152,7 @@ class TestEventProcessor(unittest.TestCase):
         self.write_events(out_of_order_events)
         self.processor.recover_and_process()
 
-        print("State after handling out-of-order events:", json.dumps(self.processor.state, indent=2))
+        self.print_state("State after handling out-of-order events:")
         self.assertEqual(len(self.processor.state), len(test_events))  # Should still process all events
 
     def test_large_volume(self):
@@ -116,13 +160,522 @@ class TestEventProcessor(unittest.TestCase):
         Test Scenario 5: Large Volume Handling
         Tests how the processor handles a large dataset (1,000+ events).
         """
-        print("\nRunning test_large_volume...")
+        log("\nRunning test_large_volume...")
         large_event_log = [{"id": f"A{i}", "category": "sales", "value": i * 10} for i in range(1, 1001)]
         self.write_events(large_event_log)
         self.processor.recover_and_process()
 
-        print(f"Processed {len(self.processor.state)} events in large volume test.")
+        log(f"Processed {len(self.processor.state)} events in large volume test.")
         self.assertEqual(len(self.processor.state), 1000)  # Ensure all events are processed correctly
 
+    def test_large_volume_in_small_blocks(self):
+        """
+        Test Scenario 5b: Streaming in Small Blocks
+        Ensures that reading the log in blocks smaller than a line still processes every event exactly once.
+        """
+        log("\nRunning test_large_volume_in_small_blocks...")
+        large_event_log = [{"id": f"A{i}", "category": "sales", "value": i * 10} for i in range(1, 1001)]
+        self.write_events(large_event_log)
+
+        original_chunk_size = event_processor.READ_CHUNK_SIZE
+        event_processor.READ_CHUNK_SIZE = 7
+        try:
+            self.processor.recover_and_process()
+        finally:
+            event_processor.READ_CHUNK_SIZE = original_chunk_size
+
+        log(f"Processed {len(self.processor.state)} events in small block test.")
+        self.assertEqual(len(self.processor.state), 1000)
+        self.assertEqual(self.processor.state["A1000"]["value"], 10000)
+        self.assertEqual(self.processor._log_offset, os.path.getsize(EVENT_LOG_FILE))
+
+    def test_large_volume_parallel_parse(self):
+        """
+        Test Scenario 5c: Parallel Parsing
+        Ensures that parsing a large log in worker processes gives the same state as a serial read.
+        """
+        log("\nRunning test_large_volume_parallel_parse...")
+        large_event_log = [{"id": f"A{i}", "category": "sales", "value": i * 10} for i in range(1, 1001)]
+        self.write_events(large_event_log + large_event_log[:10])  # Include some duplicates
+
+        original_settings = (event_processor.PARALLEL_PARSE_MIN_BYTES, event_processor.PARSE_WORKERS,
+                             event_processor.READ_CHUNK_SIZE)
+        # Small ranges, so there are more ranges than can be in flight at once
+        event_processor.PARALLEL_PARSE_MIN_BYTES, event_processor.PARSE_WORKERS = 0, 2
+        event_processor.READ_CHUNK_SIZE = 1000
+        try:
+            self.assertTrue(self.processor.recover_and_process())
+        finally:
+            (event_processor.PARALLEL_PARSE_MIN_BYTES, event_processor.PARSE_WORKERS,
+             event_processor.READ_CHUNK_SIZE) = original_settings
+
+        log(f"Processed {len(self.processor.state)} events in parallel parse test.")
+        self.assertEqual(len(self.processor.state), 1000)
+        self.assertEqual(list(self.processor.state)[:3], ["A1", "A2", "A3"])  # Log order is kept
+        self.assertEqual(self.processor.state["A1000"]["value"], 10000)
+        self.assertEqual(self.processor._log_offset, os.path.getsize(EVENT_LOG_FILE))
+
+    def test_parallel_parse_falls_back_to_serial(self):
+        """
+        Test Scenario 5d: Broken Worker Pool
+        Ensures that if the parsing workers die (or cannot start, e.g. in a script
+        without a main guard), the rest of the log is read serially and nothing is lost.
+        """
+        log("\nRunning test_parallel_parse_falls_back_to_serial...")
+        large_event_log = [{"id": f"A{i}", "category": "sales", "value": i * 10} for i in range(1, 1001)]
+        self.write_events(large_event_log)
+
+        class BrokenAfterFirstRangePool:
+            """Parses the first range inline, then behaves like a pool whose workers died."""
+            def __init__(self, max_workers, mp_context):
+                self.submitted = 0
+            def __enter__(self):
+                return self
+            def __exit__(self, *exc_info):
+                return False
+            def submit(self, fn, *args):
+                self.submitted += 1
+                future = Future()
+                if self.submitted == 1:
+                    future.set_result(fn(*args))
+                else:
+                    future.set_exception(BrokenProcessPool("A worker process died"))
+                return future
+
+        original_settings = (event_processor.PARALLEL_PARSE_MIN_BYTES, event_processor.PARSE_WORKERS,
+                             event_processor.READ_CHUNK_SIZE, event_processor.ProcessPoolExecutor)
+        event_processor.PARALLEL_PARSE_MIN_BYTES, event_processor.PARSE_WORKERS = 0, 2
+        event_processor.READ_CHUNK_SIZE = 1000
+        event_processor.ProcessPoolExecutor = BrokenAfterFirstRangePool
+        try:
+            self.assertTrue(self.processor.recover_and_process())
+        finally:
+            (event_processor.PARALLEL_PARSE_MIN_BYTES, event_processor.PARSE_WORKERS,
+             event_processor.READ_CHUNK_SIZE, event_processor.ProcessPoolExecutor) = original_settings
+
+        self.assertEqual(list(self.processor.state), [event["id"] for event in large_event_log])
+        self.assertEqual(self.processor._log_offset, os.path.getsize(EVENT_LOG_FILE))
+
+    def test_incremental_log_offset(self):
+        """
+        Test Scenario 6: Incremental Tail Reading
+        Ensures that only events appended since the last run are read, resuming from the saved log offset.
+        """
+        log("\nRunning test_incremental_log_offset...")
+        self.write_events(test_events[:3])
+        self.processor.recover_and_process()
+        offset = os.path.getsize(EVENT_LOG_FILE)
+
+        # Append the remaining events and resume with a fresh processor
+        with open(EVENT_LOG_FILE, "a") as f:
+            for event in test_events[3:]:
+                f.write(json.dumps(event) + "\n")
+        self.processor.close()
+        self.processor = EventProcessor()
+        self.assertEqual(self.processor._log_offset, offset)  # Resumes from where the last run stopped reading
+        self.assertTrue(self.processor.recover_and_process())
+
+        self.print_state("State after incremental processing:")
+        self.assertEqual(len(self.processor.state), len(test_events))
+        self.assertEqual(self.processor._log_offset, os.path.getsize(EVENT_LOG_FILE))
+
+    def test_event_log_replaced(self):
+        """
+        Test Scenario 6b: Replaced Event Log
+        Ensures that when the event log is replaced by a new file, the kept-open
+        log is reopened and the new file is read from the start.
+        """
+        log("\nRunning test_event_log_replaced...")
+        self.write_events(test_events)
+        self.processor.recover_and_process()
+
+        # Replace the log with a new file; the old handle would still read the deleted one
+        os.remove(EVENT_LOG_FILE)
+        self.write_events([{"id": "B1", "category": "sales", "value": 1}])
+        self.assertTrue(self.processor.recover_and_process())
+
+        self.print_state("State after replacing the event log:")
+        self.assertIn("B1", self.processor.state)
+        self.assertEqual(len(self.processor.state), len(test_events) + 1)
+
+        # A replacement after a restart but before the first read is detected too
+        self.processor.close()
+        self.processor = EventProcessor()
+        os.replace(EVENT_LOG_FILE, EVENT_LOG_FILE + ".1")  # Rotated, so the new file gets a new inode
+        self.write_events([{"id": "C1", "category": "sales", "value": 1},
+                           {"id": "C2", "category": "sales", "value": 2}])
+        os.remove(EVENT_LOG_FILE + ".1")
+        self.assertTrue(self.processor.recover_and_process())
+        self.assertIn("C1", self.processor.state)
+        self.assertEqual(self.processor._log_offset, os.path.getsize(EVENT_LOG_FILE))
+
+    def test_event_log_replaced_while_stopped(self):
+        """
+        Test Scenario 6c: Event Log Replaced Between Runs
+        Ensures that when the event log is replaced while the processor is stopped,
+        the new file is read from the start even if it is larger than the saved offset,
+        whether that offset was restored from the write-ahead log or a checkpoint.
+        """
+        log("\nRunning test_event_log_replaced_while_stopped...")
+
+        def replace_log(prefix, count):
+            # Swap in a new file, as log rotation would
+            with open(EVENT_LOG_FILE + ".new", "w") as f:
+                for i in range(count):
+                    f.write(json.dumps({"id": f"{prefix}{i}", "category": "sales", "value": i}) + "\n")
+            os.replace(EVENT_LOG_FILE + ".new", EVENT_LOG_FILE)
+            return [f"{prefix}{i}" for i in range(count)]
+
+        expected = replace_log("A", 3)
+        self.processor.recover_and_process()
+        self.processor.close()
+
+        expected += replace_log("B", 5)
+        self.processor = EventProcessor()  # Offset restored from the write-ahead log
+        self.assertTrue(self.processor.recover_and_process())
+        self.assertEqual(list(self.processor.state), expected)
+
+        self.processor.save_checkpoint()
+        self.processor.close()
+        expected += replace_log("C", 7)
+        self.processor = EventProcessor()  # Offset restored from the checkpoint
+        self.assertTrue(self.processor.recover_and_process())
+
+        self.print_state("State after replacing the event log between runs:")
+        self.assertEqual(list(self.processor.state), expected)
+        self.assertEqual(self.processor._log_offset, os.path.getsize(EVENT_LOG_FILE))
+
+    def test_write_ahead_log_recovery(self):
+        """
+        Test Scenario 7: Write-Ahead Log Recovery & Compaction
+        Ensures that state is rebuilt from the write-ahead log after a restart,
+        and that compaction folds the log into a full checkpoint.
+        """
+        log("\nRunning test_write_ahead_log_recovery...")
+        self.write_events(test_events)
+        self.processor.recover_and_process()
+        self.assertFalse(os.path.exists(CHECKPOINT_FILE))  # Small batches only append to the log
+        state = self.processor.state
+
+        self.processor.close()
+        self.processor = EventProcessor()  # Simulate a restart
+        self.assertEqual(self.processor.state, state)
+        self.assertFalse(self.processor.recover_and_process())  # Nothing new to process
+
+        self.processor.close()
+        original_min_bytes = event_processor.WAL_COMPACTION_MIN_BYTES
+        event_processor.WAL_COMPACTION_MIN_BYTES = 0
+        try:
+            self.processor = EventProcessor()
+            self.write_events(test_events + [{"id": "A7", "category": "sales", "value": 400}])
+            self.processor.recover_and_process()
+        finally:
+            event_processor.WAL_COMPACTION_MIN_BYTES = original_min_bytes
+
+        self.assertEqual(os.path.getsize(CHECKPOINT_WAL_FILE), 0)  # Log was compacted into the checkpoint
+        self.processor.close()  # Waits for the background checkpoint write
+        self.assertTrue(os.path.exists(CHECKPOINT_FILE))
+        self.assertFalse(os.path.exists(PREVIOUS_WAL_FILE))
+        self.processor = EventProcessor()
+        self.print_state("State after recovery from checkpoint:")
+        self.assertEqual(len(self.processor.state), len(test_events) + 1)
+
+    def test_crash_during_checkpoint_write(self):
+        """
+        Test Scenario 8: Crash While a Checkpoint Is Being Written
+        Ensures that a write-ahead log set aside for a checkpoint that never
+        reached disk is still replayed on recovery.
+        """
+        log("\nRunning test_crash_during_checkpoint_write...")
+        self.write_events(test_events)
+        self.processor.recover_and_process()
+        self.processor.close()
+
+        # Set the log aside as save_checkpoint does, without writing the checkpoint
+        os.replace(CHECKPOINT_WAL_FILE, PREVIOUS_WAL_FILE)
+        self.processor = EventProcessor()
+
+        self.print_state("State after recovery from the set-aside log:")
+        self.assertEqual(len(self.processor.state), len(test_events))
+        self.assertFalse(self.processor.recover_and_process())  # Log offset was recovered as well
+
+    def test_columnar_state(self):
+        """
+        Test Scenario 9: Columnar State Storage
+        Ensures that records read back from the column-wise state match what was
+        stored, including values that do not fit a 64-bit integer column.
+        """
+        log("\nRunning test_columnar_state...")
+        state = EventState()
+        self.assertTrue(state.add("A1", "sales", 100, 0))
+        self.assertFalse(state.add("A1", "inventory", 5, 2))  # Duplicate IDs are ignored
+        self.assertTrue(state.add("A2", "inventory", 2.5, 1_700_000_000_123_456_789))
+        self.assertTrue(state.add("A3", "sales", 2**70, 4))
+
+        self.assertEqual(len(state), 3)
+        self.assertEqual(state["A1"], {"category": "sales", "value": 100, "processed_at": "1970-01-01T00:00:00"})
+        self.assertEqual(state["A2"], {"category": "inventory", "value": 2.5, "processed_at": "2023-11-14T22:13:20.123456"})
+        self.assertEqual(state["A3"]["value"], 2**70)
+        self.assertEqual(list(state), ["A1", "A2", "A3"])
+        self.assertIs(state["A1"]["category"], state["A3"]["category"])  # One shared category string
+
+        restored = pickle.loads(pickle.dumps(state, protocol=5))  # As stored in a checkpoint
+        self.assertEqual(dict(restored), dict(state))
+        self.assertTrue(restored.add("A4", "sales", 1, 5))  # Columns and category codes are usable again
+        self.assertEqual(restored["A4"]["category"], "sales")
+
+    def test_format_timestamp(self):
+        """
+        Test Scenario 10: Timestamp Formatting
+        Ensures that stored nanosecond timestamps are formatted exactly like datetime.isoformat().
+        """
+        log("\nRunning test_format_timestamp...")
+        for timestamp_ns in [0, 1_700_000_000_000_000_000, 1_700_000_000_000_001_000, time.time_ns()]:
+            expected = datetime(1970, 1, 1) + timedelta(microseconds=timestamp_ns // 1000)
+            self.assertEqual(format_timestamp(timestamp_ns), expected.isoformat())
+
+    def test_identical_records_share_rows(self):
+        """
+        Test Scenario 11: Shared Rows for Identical Records
+        Ensures that events with the same category and value processed in one
+        batch share a stored row, while every event ID still maps to its record.
+        """
+        log("\nRunning test_identical_records_share_rows...")
+        state = EventState()
+        state.add("A1", "sales", 100, 1000)
+        state.add("A2", "sales", 100, 1000)  # Same batch and contents as A1
+        state.add("A3", "sales", 100.0, 1000)  # Equal value of a different type
+        state.add("A4", "sales", [1, 2], 1000)  # Unhashable value
+        state.add("A5", "sales", 100, 2000)  # Next batch
+        state.add("A6", "sales", 0.0, 2000)
+        state.add("A7", "sales", -0.0, 2000)  # Equal to 0.0 but a distinct value
+
+        self.assertEqual(len(state), 7)
+        self.assertEqual(stored_rows(state), 6)  # Only A1 and A2 share a row
+        self.assertEqual(state["A2"], state["A1"])
+        self.assertIs(type(state["A3"]["value"]), float)
+        self.assertEqual(str(state["A7"]["value"]), "-0.0")
+        self.assertEqual(state["A4"]["value"], [1, 2])
+        self.assertNotEqual(state["A5"]["processed_at"], state["A1"]["processed_at"])
+
+        restored = pickle.loads(pickle.dumps(state, protocol=5))
+        self.assertEqual(dict(restored), dict(state))
+
+    def test_row_sharing_is_bounded(self):
+        """
+        Test Scenario 11b: Bounded Row Sharing
+        Ensures that only the first BATCH_ROW_MEMO_SIZE distinct records of a batch
+        are remembered for sharing, so batches of unique records stay cheap.
+        """
+        log("\nRunning test_row_sharing_is_bounded...")
+        limit = event_processor.BATCH_ROW_MEMO_SIZE
+        state = EventState()
+        for i in range(limit + 10):
+            state.add(f"A{i}", "sales", i, 1000)
+        self.assertEqual(stored_rows(state), limit + 10)
+
+        state.add("B1", "sales", 0, 1000)  # Remembered, so it shares A0's row
+        self.assertEqual(stored_rows(state), limit + 10)
+        state.add("B2", "sales", limit + 5, 1000)  # Past the limit, so it gets its own row
+        self.assertEqual(stored_rows(state), limit + 11)
+        self.assertEqual(state["B2"], state[f"A{limit + 5}"])
+
+    def test_row_sharing_ends_with_batch(self):
+        """
+        Test Scenario 11c: Row Sharing Released After a Batch
+        Ensures that records are only shared within one process_events batch,
+        so nothing is held on to between batches, even with the same timestamp.
+        """
+        log("\nRunning test_row_sharing_ends_with_batch...")
+        for batch in ("A", "B"):
+            self.processor.process_events(
+                [{"id": f"{batch}{i}", "category": "sales", "value": 1} for i in range(3)], 1000)
+
+        state = self.processor.state
+        self.assertEqual(len(state), 6)
+        self.assertEqual(stored_rows(state), 2)  # One row per batch
+        self.assertEqual(state["B0"], state["A0"])
+
+    def test_invalid_event_keeps_earlier_changes(self):
+        """
+        Test Scenario 12: Invalid Event in a Batch
+        Ensures that events processed before an invalid one are still written to
+        the write-ahead log, so they survive a restart.
+        """
+        log("\nRunning test_invalid_event_keeps_earlier_changes...")
+        with self.assertRaises(KeyError):
+            self.processor.process_events([test_events[0], {"id": "A2", "category": "sales"}])
+        self.assertIn("A1", self.processor.state)
+
+        self.processor.close()
+        self.processor = EventProcessor()  # Simulate a restart
+        self.assertEqual(list(self.processor.state), ["A1"])
+
+    def test_invalid_event_in_log(self):
+        """
+        Test Scenario 13: Invalid Event in the Log
+        Ensures that an invalid event keeps failing instead of the events after it being skipped.
+        """
+        log("\nRunning test_invalid_event_in_log...")
+        self.write_events([test_events[0], {"id": "A2", "category": "sales"}, test_events[2]])
+        with self.assertRaises(KeyError):
+            self.processor.recover_and_process()
+        self.assertEqual(self.processor._log_offset, 0)  # The block was not marked as read
+
+        with open(EVENT_LOG_FILE, "a") as f:
+            f.write(json.dumps(test_events[3]) + "\n")
+        with self.assertRaises(KeyError):
+            self.processor.recover_and_process()
+        self.assertNotIn("A3", self.processor.state)  # A3 is still ahead of the invalid event
+
+    def test_legacy_json_checkpoint(self):
+        """
+        Test Scenario 14: Upgrading From a JSON Checkpoint
+        Ensures that a checkpoint.json from earlier versions is imported, keeping the
+        original processing timestamps, and that already processed events are not redone.
+        """
+        log("\nRunning test_legacy_json_checkpoint...")
+        self.processor.close()
+        legacy_state = {
+            event["id"]: {"category": event["category"], "value": event["value"],
+                          "processed_at": "2025-01-31T12:00:00.123456"}
+            for event in test_events[:3]
+        }
+        with open(LEGACY_CHECKPOINT_FILE, "w") as f:
+            json.dump({"processed_events": list(legacy_state), "timestamp": "2025-01-31T12:00:01", "state": legacy_state}, f)
+        self.write_events(test_events)
+
+        self.processor = EventProcessor()
+        self.assertTrue(os.path.exists(CHECKPOINT_FILE))  # Imported state is saved in the new format
+        self.assertEqual(dict(self.processor.state), legacy_state)
+
+        self.assertTrue(self.processor.recover_and_process())
+        self.assertEqual(len(self.processor.state), len(test_events))
+        self.assertEqual(self.processor.state["A1"]["processed_at"], "2025-01-31T12:00:00.123456")
+
+    def test_two_crashes_during_checkpoint_writes(self):
+        """
+        Test Scenario 15: Two Crashes in a Row While Checkpoints Are Written
+        Ensures that a set-aside write-ahead log is never overwritten by a later
+        compaction before a checkpoint covering it is on disk.
+        """
+        log("\nRunning test_two_crashes_during_checkpoint_writes...")
+        self.write_events(test_events[:3])
+        self.processor.recover_and_process()
+        self.processor.close()
+        os.replace(CHECKPOINT_WAL_FILE, PREVIOUS_WAL_FILE)  # First crash, after the log was set aside
+
+        original = event_processor._write_checkpoint, event_processor.WAL_COMPACTION_MIN_BYTES
+        event_processor._write_checkpoint = lambda data: None  # No checkpoint ever reaches disk
+        event_processor.WAL_COMPACTION_MIN_BYTES = 0
+        try:
+            self.processor = EventProcessor()
+            with open(EVENT_LOG_FILE, "a") as f:
+                f.write(json.dumps({"id": "B1", "category": "sales", "value": 1}) + "\n")
+            self.processor.recover_and_process()  # Compacts; second crash before the write lands
+            self.processor.close()
+        finally:
+            event_processor._write_checkpoint, event_processor.WAL_COMPACTION_MIN_BYTES = original
+
+        self.processor = EventProcessor()
+        self.print_state("State after two crashes:")
+        self.assertEqual(sorted(self.processor.state), ["A1", "A2", "A3", "B1"])
+        self.assertFalse(os.path.exists(PREVIOUS_WAL_FILE))  # Startup wrote a covering checkpoint
+        self.assertTrue(os.path.exists(CHECKPOINT_FILE))
+
+    def test_close_after_failed_checkpoint_write(self):
+        """
+        Test Scenario 15b: Failed Background Checkpoint Write
+        Ensures that an error from the background checkpoint write is raised on
+        close, and that the event log and write-ahead log are still closed.
+        """
+        log("\nRunning test_close_after_failed_checkpoint_write...")
+        self.write_events(test_events)
+        self.processor.recover_and_process()
+
+        def failing_write(data):
+            raise OSError("No space left on device")
+
+        original = event_processor._write_checkpoint
+        event_processor._write_checkpoint = failing_write
+        try:
+            self.processor.save_checkpoint()
+        finally:
+            event_processor._write_checkpoint = original
+
+        event_log = self.processor._event_log
+        with self.assertRaises(OSError):
+            self.processor.close()
+        self.assertTrue(event_log.closed)
+        self.assertTrue(self.processor._wal.closed)
+
+    def test_torn_write_ahead_log_entry(self):
+        """
+        Test Scenario 16: Torn Write-Ahead Log Entry
+        Ensures that a partially written log entry left by a crash is dropped,
+        so that changes logged after the restart are still replayed.
+        """
+        log("\nRunning test_torn_write_ahead_log_entry...")
+        self.write_events(test_events[:3])
+        self.processor.recover_and_process()
+        self.processor.close()
+        with open(CHECKPOINT_WAL_FILE, "ab") as f:
+            f.write(b'["A4", "sal')  # Crash in the middle of writing an entry
+
+        self.processor = EventProcessor()
+        self.write_events(test_events)
+        self.processor.recover_and_process()
+        self.processor.close()
+
+        self.processor = EventProcessor()
+        self.assertEqual(len(self.processor.state), len(test_events))
+
+    def test_non_string_categories(self):
+        """
+        Test Scenario 17: Non-String Categories
+        Ensures that categories of other JSON types are stored and read back
+        unchanged, without equal values of different types being merged.
+        """
+        log("\nRunning test_non_string_categories...")
+        state = EventState()
+        categories = {"A1": 1, "A2": True, "A3": 1.0, "A4": ["a"], "A5": ["a"], "A6": {"b": 1}, "A7": None}
+        for event_id, category in categories.items():
+            self.assertTrue(state.add(event_id, category, 1, 1000))
+
+        restored = pickle.loads(pickle.dumps(state, protocol=5))
+        for current in (state, restored):
+            for event_id, category in categories.items():
+                self.assertEqual(current[event_id]["category"], category)
+                self.assertIs(type(current[event_id]["category"]), type(category))
+        self.assertEqual(len(state._categories), 6)  # The two ["a"] categories share a code
+
+    def test_checkpoint_has_no_shared_objects(self):
+        """
+        Test Scenario 18: Checkpoint Pickled Without a Memo
+        Ensures that no container in a checkpoint is reachable twice, which
+        pickling in fast mode relies on, and that it round-trips intact.
+        """
+        log("\nRunning test_checkpoint_has_no_shared_objects...")
+        with open(EVENT_LOG_FILE, "w") as f:
+            for event in test_events:
+                f.write(json.dumps(event) + "\n")
+            f.write(json.dumps({"id": "B1", "category": ["a"], "value": 2 ** 70}) + "\n")
+            f.write(json.dumps({"id": "B2", "category": {"b": 1}, "value": -0.0}) + "\n")
+        self.processor.recover_and_process()
+
+        checkpoint = event_processor.Checkpoint(self.processor.state, self.processor._log_offset, 0)
+        seen = set()
+        pending = [checkpoint, self.processor.state.__getstate__()]
+        while pending:
+            obj = pending.pop()
+            if isinstance(obj, (list, tuple, dict)):
+                self.assertNotIn(id(obj), seen)
+                seen.add(id(obj))
+                pending.extend(obj.values() if isinstance(obj, dict) else obj)
+
+        restored = pickle.loads(event_processor._dump_checkpoint(checkpoint))
+        self.assertEqual(dict(restored.state.items()), dict(self.processor.state.items()))
+        self.assertEqual(restored.log_offset, self.processor._log_offset)
+
 if __name__ == "__main__":
     unittest.main()